@@ -1,13 +1,12 @@
 # main.py
 
 import argparse
+import functools
 import os
-import sys
 import logging
 
-# Add the agent package to the Python path
-sys.path.append(os.path.join(os.path.dirname(__file__), "txn_insights_agent"))
-
+from txn_insights_agent._config import DATASET_ID
+from txn_insights_agent._sql import SCHEDULED_QUERIES, scheduled_query
 from txn_insights_agent.agent import root_agent
 
 # Set up basic logging
@@ -18,8 +17,86 @@ logger = logging.getLogger(__name__)
 def run_locally():
     """Starts the local ADK web development server."""
     logger.info("Starting ADK web server for local development...")
-    from google.adk import web
-    web.main(args=["--agent_path=txn_insights_agent/agent.py", "--"])
+    from google.adk.cli.cli_tools_click import main as adk_cli
+    # `adk web` discovers agent packages in this directory and imports txn_insights_agent by module name.
+    adk_cli(args=["web", os.path.dirname(os.path.abspath(__file__))])
+
+
+def _read_requirements():
+    """Returns the package requirements listed in requirements.txt, without comments or blank lines."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "requirements.txt")
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def ensure_bi_engine_reservation(project_id):
+    """
+    Makes sure the project's BI Engine reservation can serve the agent's aggregate queries from memory.
+    The reservation is shared by the whole project, so it is only ever grown, and the agent's tables are
+    added to its preferred tables rather than replacing them.
+    """
+    try:
+        from google.cloud import bigquery_reservation_v1
+        from google.api_core import exceptions
+    except ImportError:
+        logger.warning("BigQuery Reservation SDK not found, skipping BI Engine setup. Install it with: pip install google-cloud-bigquery-reservation")
+        return
+
+    bq_location = os.getenv("BIGQUERY_LOCATION", "US")
+    size_bytes = int(os.getenv("BI_ENGINE_SIZE_GB", "2")) * 1024**3
+    preferred_tables = ["transactions", "mv_monthly_consumer_rollup", "mv_persona_monthly"]
+
+    client = bigquery_reservation_v1.ReservationServiceClient()
+    name = f"projects/{project_id}/locations/{bq_location}/biReservation"
+    try:
+        current = client.get_bi_reservation(name=name)
+    except exceptions.GoogleAPICallError as e:
+        logger.error(f"Failed to read the BI Engine reservation: {e}")
+        return
+
+    update_paths = []
+    if current.size < size_bytes:
+        update_paths.append("size")
+    # An existing reservation with no preferred tables already accelerates every table; listing ours would narrow it.
+    table_refs = list(current.preferred_tables)
+    if table_refs or not current.size:
+        existing = {(ref.project_id, ref.dataset_id, ref.table_id) for ref in table_refs}
+        missing = [
+            bigquery_reservation_v1.TableReference(project_id=project_id, dataset_id=DATASET_ID, table_id=table_id)
+            for table_id in preferred_tables
+            if (project_id, DATASET_ID, table_id) not in existing
+        ]
+        if missing:
+            table_refs.extend(missing)
+            update_paths.append("preferred_tables")
+    if not update_paths:
+        logger.info(f"BI Engine reservation in '{bq_location}' already covers '{DATASET_ID}'; leaving it unchanged.")
+        return
+
+    logger.info(f"Updating the BI Engine reservation in '{bq_location}' ({', '.join(update_paths)}) for '{DATASET_ID}'...")
+    bi_reservation = bigquery_reservation_v1.BiReservation(
+        name=name,
+        size=max(current.size, size_bytes),
+        preferred_tables=table_refs,
+    )
+    try:
+        client.update_bi_reservation(
+            bi_reservation=bi_reservation,
+            update_mask={"paths": update_paths},
+        )
+    except exceptions.GoogleAPICallError as e:
+        logger.error(f"Failed to update the BI Engine reservation: {e}")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_adk_app():
+    """Wraps the ADK agent in an AdkApp object to make it deployable. Built once per process."""
+    from vertexai.preview import reasoning_engines
+    return reasoning_engines.AdkApp(
+        agent=root_agent,
+        enable_tracing=True,
+    )
 
 
 def deploy_to_agent_engine():
@@ -44,20 +121,17 @@ def deploy_to_agent_engine():
     logger.info(f"Initializing Vertex AI for project '{project_id}' in '{location}'...")
     vertexai.init(project=project_id, location=location, staging_bucket=staging_bucket)
 
-    # Wrap the ADK agent in an AdkApp object to make it deployable
-    app = reasoning_engines.AdkApp(
-        agent=root_agent,
-        enable_tracing=True,
-    )
+    ensure_bi_engine_reservation(project_id)
+
+    app = _get_adk_app()
 
     logger.info("Creating and deploying the agent engine... This may take several minutes.")
     remote_app = reasoning_engines.create(
         reasoning_engine=app,
-        # Add the new dependency here
-        requirements=[
-            "google-cloud-aiplatform[adk,agent_engines]",
-            "google-cloud-bigquery"
-            ],
+        # The same dependencies as a local install, so the two never drift apart.
+        requirements=_read_requirements(),
+        # Ships the package source, including its instructions/*.md templates.
+        extra_packages=["txn_insights_agent"],
         display_name="TXN Insights Agent",
         description="Agent for analyzing financial transaction data."
     )
@@ -70,12 +144,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run or deploy the TXN Insights ADK Agent.")
     parser.add_argument(
         "command",
-        choices=["local", "deploy"],
-        help="Choose 'local' to run the dev server or 'deploy' to deploy to Agent Engine."
+        choices=["local", "deploy", "sql"],
+        help="Choose 'local' to run the dev server, 'deploy' to deploy to Agent Engine, or 'sql' to print a scheduled query."
+    )
+    parser.add_argument(
+        "name",
+        nargs="?",
+        choices=SCHEDULED_QUERIES,
+        help="The scheduled query to print with the 'sql' command."
     )
     args = parser.parse_args()
 
     if args.command == "local":
         run_locally()
     elif args.command == "deploy":
-        deploy_to_agent_engine()
\ No newline at end of file
+        deploy_to_agent_engine()
+    elif args.command == "sql":
+        if args.name is None:
+            parser.error("the 'sql' command needs the name of a scheduled query")
+        print(scheduled_query(args.name))
\ No newline at end of file
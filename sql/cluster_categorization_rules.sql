@@ -0,0 +1,19 @@
+-- sql/cluster_categorization_rules.sql
+--
+-- One-time migration that rebuilds `categorization_rules` clustered by its
+-- match keys, so the rule lookups made by the conflict resolution and rule
+-- enhancement workflows (by identifier, rule type and persona) read only the
+-- matching blocks.
+--
+--   bq query --use_legacy_sql=false < sql/cluster_categorization_rules.sql
+--
+-- The rename swaps the new table in place; re-run the rule_conflicts scheduled
+-- query afterwards (python main.py sql rule_conflicts | bq query --use_legacy_sql=false).
+
+CREATE TABLE equifax_txns.categorization_rules_clustered
+CLUSTER BY identifier, rule_type, persona_type
+AS
+SELECT * FROM equifax_txns.categorization_rules;
+
+ALTER TABLE equifax_txns.categorization_rules RENAME TO categorization_rules_unclustered;
+ALTER TABLE equifax_txns.categorization_rules_clustered RENAME TO categorization_rules;
@@ -0,0 +1,69 @@
+-- sql/materialized_views.sql
+--
+-- Pre-aggregated monthly rollups used by the Consumer and Persona menus and
+-- the Recurring Transaction Analysis workflow.
+-- Run once against the project that hosts the `equifax_txns` dataset:
+--
+--   bq query --use_legacy_sql=false < sql/materialized_views.sql
+--
+-- BigQuery refreshes the views automatically, so results are never more than
+-- `refresh_interval_minutes` behind the base `transactions` table.
+
+-- Monthly rollup per consumer and category.
+CREATE OR REPLACE MATERIALIZED VIEW equifax_txns.mv_monthly_consumer_rollup
+OPTIONS (enable_refresh = true, refresh_interval_minutes = 60)
+AS
+SELECT
+  consumer_name,
+  persona_type,
+  DATE_TRUNC(transaction_date, MONTH) AS mo,
+  transaction_type,
+  category_l1,
+  SUM(amount) AS amt,
+  COUNT(*) AS n,
+  AVG(amount) AS avg_amt,
+  MAX(transaction_date) AS last_txn_date
+FROM equifax_txns.transactions
+GROUP BY consumer_name, persona_type, mo, transaction_type, category_l1;
+
+-- Monthly rollup per persona and category. `consumers_hll` is an HLL++ sketch
+-- of the consumers in each group; merge it with HLL_COUNT.MERGE to count
+-- distinct consumers across months or categories without rescanning.
+CREATE OR REPLACE MATERIALIZED VIEW equifax_txns.mv_persona_monthly
+OPTIONS (enable_refresh = true, refresh_interval_minutes = 60)
+AS
+SELECT
+  persona_type,
+  DATE_TRUNC(transaction_date, MONTH) AS mo,
+  transaction_type,
+  category_l1,
+  SUM(amount) AS amt,
+  COUNT(*) AS n,
+  AVG(amount) AS avg_amt,
+  HLL_COUNT.INIT(consumer_name) AS consumers_hll
+FROM equifax_txns.transactions
+GROUP BY persona_type, mo, transaction_type, category_l1;
+
+-- Monthly candidates for the Recurring Transaction Analysis workflow: not yet
+-- recurring transactions grouped by merchant and type. Materialized views
+-- cannot compute STDDEV, so the rollup keeps sums and sums of squares of the
+-- amount and day of month; all columns re-aggregate across months, and the
+-- standard deviations are derived at query time.
+CREATE OR REPLACE MATERIALIZED VIEW equifax_txns.mv_recurring_candidates
+OPTIONS (enable_refresh = true, refresh_interval_minutes = 60)
+AS
+SELECT
+  merchant_name_cleaned,
+  transaction_type,
+  persona_type,
+  DATE_TRUNC(transaction_date, MONTH) AS mo,
+  COUNT(*) AS cnt,
+  SUM(amount) AS sum_amt,
+  SUM(amount * amount) AS sum_amt_sq,
+  SUM(EXTRACT(DAY FROM transaction_date)) AS sum_day,
+  SUM(EXTRACT(DAY FROM transaction_date) * EXTRACT(DAY FROM transaction_date)) AS sum_day_sq,
+  MIN(transaction_date) AS first_seen,
+  MAX(transaction_date) AS last_seen
+FROM equifax_txns.transactions
+WHERE is_recurring = FALSE OR is_recurring IS NULL
+GROUP BY merchant_name_cleaned, transaction_type, persona_type, mo;
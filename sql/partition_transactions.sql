@@ -0,0 +1,27 @@
+-- sql/partition_transactions.sql
+--
+-- One-time migration that rebuilds `transactions` partitioned by
+-- transaction_date and clustered by the agent's context filters, so the
+-- session date range prunes partitions and the persona / consumer / merchant
+-- filters skip blocks within them.
+--
+--   bq query --use_legacy_sql=false < sql/partition_transactions.sql
+--
+-- The rename swaps the new table in place; re-run sql/materialized_views.sql
+-- and sql/views.sql afterwards so the rollups point at the new table.
+--
+-- If the table was already migrated with the earlier clustering, switch it to
+-- the current columns instead; BigQuery re-clusters existing data in the
+-- background:
+--
+--   bq update --clustering_fields=persona_type,consumer_name,merchant_name_cleaned \
+--     equifax_txns.transactions
+
+CREATE TABLE equifax_txns.transactions_partitioned
+PARTITION BY transaction_date
+CLUSTER BY persona_type, consumer_name, merchant_name_cleaned
+AS
+SELECT * FROM equifax_txns.transactions;
+
+ALTER TABLE equifax_txns.transactions RENAME TO transactions_unpartitioned;
+ALTER TABLE equifax_txns.transactions_partitioned RENAME TO transactions;
@@ -0,0 +1,15 @@
+-- sql/views.sql
+--
+-- Dimension views used to populate the Consumer / Persona pickers.
+-- Run after sql/materialized_views.sql:
+--
+--   bq query --use_legacy_sql=false < sql/views.sql
+--
+-- Reading from the monthly rollup rather than `transactions` keeps the scan
+-- bounded by the number of consumer-months instead of the number of rows.
+
+CREATE OR REPLACE VIEW equifax_txns.v_consumers AS
+SELECT DISTINCT
+  consumer_name,
+  persona_type
+FROM equifax_txns.mv_monthly_consumer_rollup;
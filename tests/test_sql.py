@@ -0,0 +1,161 @@
+# tests/test_sql.py
+
+import pytest
+
+from txn_insights_agent._sql import (
+    DML_PREFIX,
+    normalize_sql,
+    param_type,
+    table_pattern,
+    to_query_parameters,
+)
+
+
+# --- normalize_sql ---
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT  a,\n\tb\n  FROM t  ", "SELECT a, b FROM t"),
+        ("SELECT a -- trailing comment\nFROM t", "SELECT a FROM t"),
+        ("SELECT a # hash comment\nFROM t", "SELECT a FROM t"),
+        ("/* leading\n block */ SELECT 1", "SELECT 1"),
+        ("SELECT 1 /* a */ /* b */ -- c\n", "SELECT 1"),
+    ],
+)
+def test_normalize_sql_strips_comments_and_collapses_whitespace(sql, expected):
+    assert normalize_sql(sql) == expected
+
+
+@pytest.mark.parametrize(
+    "literal",
+    [
+        "'two  spaces'",
+        "'-- not a comment'",
+        "'# not a comment'",
+        "'/* not a comment */'",
+        '"double  -- quoted"',
+        "`project-id.dataset.weird  -- name`",
+        "'''triple\n\n  quoted -- text'''",
+        '"""triple\n# double  quoted"""',
+        r"'it\'s  -- still a literal'",
+        r'"a \"quoted\"  # word"',
+    ],
+)
+def test_normalize_sql_keeps_literals_and_quoted_identifiers_verbatim(literal):
+    assert normalize_sql(f"SELECT  {literal}  AS x") == f"SELECT {literal} AS x"
+
+
+def test_normalize_sql_ends_an_escaped_literal_at_its_real_closing_quote():
+    assert normalize_sql(r"SELECT 'a\\'  --c" + "\nFROM t") == r"SELECT 'a\\' FROM t"
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT 'unterminated  -- x\n  y", "SELECT 'unterminated  -- x\n  y"),
+        ("SELECT  `unterminated  # x", "SELECT `unterminated  # x"),
+        ("SELECT  'a\nb'  FROM t", "SELECT 'a\nb'  FROM t"),
+    ],
+)
+def test_normalize_sql_leaves_text_after_an_unterminated_literal_untouched(sql, expected):
+    assert normalize_sql(sql) == expected
+
+
+# --- DML_PREFIX ---
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "INSERT INTO t (a) VALUES (1)",
+        "  update t SET a = 1 WHERE b = 2",
+        "-- comment\nDELETE FROM t WHERE a = 1",
+        "/* multi\n line */ MERGE t USING s ON t.a = s.a WHEN MATCHED THEN DELETE",
+        "# note\nUPDATE t SET a = 1",
+    ],
+)
+def test_dml_prefix_accepts_dml(sql):
+    assert DML_PREFIX.match(normalize_sql(sql))
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT a FROM t",
+        "WITH x AS (SELECT 1) SELECT * FROM x",
+        "updated_rows",
+        "-- UPDATE t SET a = 1\nSELECT 1",
+        "# UPDATE t SET a = 1\nSELECT 1",
+        "DROP TABLE t",
+    ],
+)
+def test_dml_prefix_rejects_everything_else(sql):
+    assert not DML_PREFIX.match(normalize_sql(sql))
+
+
+# --- param_type / to_query_parameters ---
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (True, "BOOL"),
+        (False, "BOOL"),
+        (0, "INT64"),
+        (42, "INT64"),
+        (1.5, "FLOAT64"),
+        ("2024-01-31", "DATE"),
+        ("2024-1-31", "STRING"),
+        ("2024-01-31T00:00:00", "STRING"),
+        ("Streaming Services", "STRING"),
+        (None, "STRING"),
+    ],
+)
+def test_param_type(value, expected):
+    assert param_type(value) == expected
+
+
+def test_to_query_parameters_builds_scalar_parameters():
+    parameters = to_query_parameters({"is_active": False, "start_date": "2024-01-01", "context": "Gig Worker"})
+    assert [(p.name, p.type_, p.value) for p in parameters] == [
+        ("is_active", "BOOL", False),
+        ("start_date", "DATE", "2024-01-01"),
+        ("context", "STRING", "Gig Worker"),
+    ]
+
+
+def test_to_query_parameters_builds_array_parameters_from_lists():
+    (rule_ids,) = to_query_parameters({"rule_ids": [3, 7]})
+    assert (rule_ids.name, rule_ids.array_type, rule_ids.values) == ("rule_ids", "INT64", [3, 7])
+
+    (empty,) = to_query_parameters({"names": []})
+    assert (empty.array_type, empty.values) == ("STRING", [])
+
+
+@pytest.mark.parametrize("params", [None, {}])
+def test_to_query_parameters_without_params(params):
+    assert to_query_parameters(params) == []
+
+
+# --- table_pattern ---
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "UPDATE `project-id.equifax_txns.transactions` SET is_recurring = TRUE",
+        "UPDATE equifax_txns.transactions SET is_recurring = TRUE",
+        "DELETE FROM TRANSACTIONS WHERE FALSE",
+    ],
+)
+def test_table_pattern_matches_the_table(sql):
+    assert table_pattern("project-id.equifax_txns.transactions").search(sql)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "UPDATE `project-id.equifax_txns.transactions_rule_impact` SET n = 0",
+        "UPDATE mytransactions SET a = 1",
+    ],
+)
+def test_table_pattern_ignores_other_tables(sql):
+    assert not table_pattern("project-id.equifax_txns.transactions").search(sql)
@@ -0,0 +1,42 @@
+# txn_insights_agent/_config.py
+
+import os
+
+# --- Constants ---
+# Fast model for menu navigation and analysis; confirmed writes escalate to the stronger model.
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gemini-2.5-flash")
+CONFIRM_MODEL = os.getenv("CONFIRM_MODEL", "gemini-2.5-pro")
+# Set to "false" to hide the Enhance Categorization Rules workflow.
+ENABLE_RULE_ENHANCEMENT = os.getenv("ENABLE_RULE_ENHANCEMENT", "true").lower() == "true"
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "fsi-banking-agentspace")
+DATASET_ID = "equifax_txns"
+TRANSACTIONS_TABLE = f"{PROJECT_ID}.{DATASET_ID}.transactions"
+RULES_TABLE = f"{PROJECT_ID}.{DATASET_ID}.categorization_rules"
+# Materialized monthly rollups, see sql/materialized_views.sql
+CONSUMER_ROLLUP_MV = f"{PROJECT_ID}.{DATASET_ID}.mv_monthly_consumer_rollup"
+PERSONA_ROLLUP_MV = f"{PROJECT_ID}.{DATASET_ID}.mv_persona_monthly"
+RECURRING_CANDIDATES_MV = f"{PROJECT_ID}.{DATASET_ID}.mv_recurring_candidates"
+# Consumer / persona dimension view, see sql/views.sql
+CONSUMERS_VIEW = f"{PROJECT_ID}.{DATASET_ID}.v_consumers"
+# Daily rule-impact rollup, see sql/transactions_rule_impact.sql
+RULE_IMPACT_TABLE = f"{PROJECT_ID}.{DATASET_ID}.transactions_rule_impact"
+# Pre-computed active rule conflicts, see sql/rule_conflicts.sql
+RULE_CONFLICTS_TABLE = f"{PROJECT_ID}.{DATASET_ID}.rule_conflicts"
+# Per-consumer headline figures, see sql/consumer_summary.sql
+CONSUMER_SUMMARY_TABLE = f"{PROJECT_ID}.{DATASET_ID}.consumer_summary"
+# Writes estimated (via dry run) to scan more than this are rejected.
+MAX_UPDATE_BYTES = 10 * 1024**3
+# SELECTs estimated (via dry run) to scan more than this are returned to the model as 'too_large'.
+MAX_SELECT_BYTES = 5 * 1024**3
+# SELECT results are reused for identical queries within this window.
+QUERY_CACHE_TTL_SECONDS = 10 * 60
+QUERY_CACHE_MAX_ENTRIES = 256
+# Consumer / persona picker lookups are reused for this long.
+DISTINCT_CACHE_TTL_SECONDS = 5 * 60
+# Each BigQuery API request gives up after QUERY_API_TIMEOUT_SECONDS; waiting for a job to
+# finish gives up after QUERY_WAIT_TIMEOUT_SECONDS. A timed-out read is cancelled (best-effort,
+# by query_and_wait); a timed-out write is left running, since it may be about to commit.
+QUERY_API_TIMEOUT_SECONDS = 30.0
+QUERY_WAIT_TIMEOUT_SECONDS = 120.0
+# SELECT results are cut off after this many rows (the same cap ADK's BigQuery toolset uses).
+MAX_RESULT_ROWS = 50
@@ -0,0 +1,78 @@
+# txn_insights_agent/_instructions.py
+
+import functools
+from importlib import resources
+
+from ._config import (
+    CONSUMERS_VIEW,
+    CONSUMER_ROLLUP_MV,
+    CONSUMER_SUMMARY_TABLE,
+    ENABLE_RULE_ENHANCEMENT,
+    PERSONA_ROLLUP_MV,
+    RECURRING_CANDIDATES_MV,
+    RULES_TABLE,
+    RULE_CONFLICTS_TABLE,
+    RULE_IMPACT_TABLE,
+    TRANSACTIONS_TABLE,
+)
+
+# --- Agent Instructions ---
+# The section templates are plain format strings shipped as package data in instructions/*.md;
+# placeholders are filled once by build_instructions(). The workflow sections are numbered when
+# the instructions are assembled, so optional ones can be left out.
+_RULE_ENHANCEMENT_MENU_ITEM = "🛠️ Enhance Categorization Rules"
+
+_ALL_DATA_MENU_ITEMS = [
+    "⚙️ Overall System Health — count consumers and merchants with `APPROX_COUNT_DISTINCT`, never `COUNT(DISTINCT ...)`.",
+    "🔬 Persona Comparison Report — totals and counts from `{PERSONA_ROLLUP_MV}`, counting consumers per persona with `HLL_COUNT.MERGE(consumers_hll)`. The rollup has no per-transaction amounts, so take any amount percentiles with `APPROX_QUANTILES(amount, 100)` on `{TRANSACTIONS_TABLE}` with the date predicate.",
+    "🧩 Categorization Method Analysis — use `APPROX_COUNT_DISTINCT` for distinct merchants or consumers per method.",
+    "⚔️ Rule Analysis & Conflict Resolution",
+    _RULE_ENHANCEMENT_MENU_ITEM,
+    "🔁 Recurring Transaction Analysis",
+    "🌍 Macro Income & Spending Trends — from `{PERSONA_ROLLUP_MV}`.",
+    "❓ Ask a Custom Question",
+]
+
+_TABLES = dict(
+    CONSUMERS_VIEW=CONSUMERS_VIEW,
+    CONSUMER_ROLLUP_MV=CONSUMER_ROLLUP_MV,
+    CONSUMER_SUMMARY_TABLE=CONSUMER_SUMMARY_TABLE,
+    PERSONA_ROLLUP_MV=PERSONA_ROLLUP_MV,
+    RECURRING_CANDIDATES_MV=RECURRING_CANDIDATES_MV,
+    RULES_TABLE=RULES_TABLE,
+    RULE_CONFLICTS_TABLE=RULE_CONFLICTS_TABLE,
+    RULE_IMPACT_TABLE=RULE_IMPACT_TABLE,
+    TRANSACTIONS_TABLE=TRANSACTIONS_TABLE,
+)
+
+
+@functools.cache
+def _load_template(name: str) -> str:
+    """Reads an instruction template from the package's instructions/ directory."""
+    return (resources.files(__package__) / "instructions" / f"{name}.md").read_text(encoding="utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def build_instructions(include_rule_enhancement: bool = True) -> str:
+    """Renders the agent instructions, optionally without the rule enhancement workflow."""
+    menu_items = [
+        item for item in _ALL_DATA_MENU_ITEMS
+        if include_rule_enhancement or item != _RULE_ENHANCEMENT_MENU_ITEM
+    ]
+    all_data_menu = "\n".join(
+        f"{number}.  {item.format(**_TABLES)}" for number, item in enumerate(menu_items, start=1)
+    )
+
+    workflows = ["rule_conflicts"]
+    if include_rule_enhancement:
+        workflows.append("rule_enhancement")
+    workflows.append("recurring")
+
+    sections = [_load_template("base").format(ALL_DATA_MENU=all_data_menu, **_TABLES)]
+    # Sections 1-3 live in the base template.
+    for section_number, name in enumerate(workflows, start=4):
+        sections.append(_load_template(name).format(section_number=section_number, **_TABLES))
+    return "\n".join(sections)
+
+
+INSTRUCTIONS = build_instructions(ENABLE_RULE_ENHANCEMENT)
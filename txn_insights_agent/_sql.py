@@ -0,0 +1,99 @@
+# txn_insights_agent/_sql.py
+
+import functools
+import re
+from importlib import resources
+from typing import Any
+
+from google.cloud import bigquery
+
+from ._config import (
+    CONSUMER_ROLLUP_MV,
+    CONSUMER_SUMMARY_TABLE,
+    RULES_TABLE,
+    RULE_CONFLICTS_TABLE,
+    RULE_IMPACT_TABLE,
+    TRANSACTIONS_TABLE,
+)
+
+# Matches statements that start with a DML keyword. Apply it to normalize_sql() output, which has
+# already dropped every comment style and the leading whitespace.
+DML_PREFIX = re.compile(r"^(insert|update|delete|merge)\b", re.IGNORECASE)
+
+
+# Splits SQL into quoted literals / identifiers (kept verbatim) and runs of comments or whitespace (collapsed).
+_SQL_TOKENS = re.compile(
+    r"(?P<quoted>'''.*?'''"
+    r'|""".*?"""'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r"|`[^`]*`"
+    # An unterminated literal or identifier keeps the rest of the text verbatim, so BigQuery rejects it as written.
+    r"|['\"`].*)"
+    r"|(?:--[^\n]*|#[^\n]*|/\*.*?\*/|\s+)+",
+    re.DOTALL,
+)
+
+
+def normalize_sql(sql_query: str) -> str:
+    """Strips comments and collapses whitespace outside string literals and quoted identifiers."""
+    return _SQL_TOKENS.sub(lambda m: m.group("quoted") or " ", sql_query).strip()
+
+
+# ISO dates passed as strings are sent as DATE parameters so they compare against DATE columns.
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def param_type(value: Any) -> str:
+    """Infers the BigQuery type of a JSON-style parameter value."""
+    # bool is checked before int because it is a subclass of int.
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    if isinstance(value, float):
+        return "FLOAT64"
+    if isinstance(value, str) and _ISO_DATE.match(value):
+        return "DATE"
+    return "STRING"
+
+
+def to_query_parameters(
+    params: dict[str, Any] | None,
+) -> list[bigquery.ScalarQueryParameter | bigquery.ArrayQueryParameter]:
+    """Converts a name -> value mapping into BigQuery query parameters; lists become ARRAY parameters."""
+    query_parameters = []
+    for name, value in (params or {}).items():
+        if isinstance(value, (list, tuple)):
+            element_type = param_type(value[0]) if value else "STRING"
+            query_parameters.append(bigquery.ArrayQueryParameter(name, element_type, list(value)))
+        else:
+            query_parameters.append(bigquery.ScalarQueryParameter(name, param_type(value), value))
+    return query_parameters
+
+
+def table_pattern(table: str) -> re.Pattern:
+    """Matches a reference to `table` by its bare name, but not to longer names that start with it."""
+    return re.compile(rf"\b{re.escape(table.rsplit('.', 1)[-1])}\b", re.IGNORECASE)
+
+
+# The scheduled queries ship as package data in sql/*.sql, with `{TABLE}` placeholders for the
+# fully qualified table names. The agent runs the same text as the BigQuery schedules
+# (see `python main.py sql <name>`), so the two never diverge.
+_TABLES = dict(
+    CONSUMER_ROLLUP_MV=CONSUMER_ROLLUP_MV,
+    CONSUMER_SUMMARY_TABLE=CONSUMER_SUMMARY_TABLE,
+    RULES_TABLE=RULES_TABLE,
+    RULE_CONFLICTS_TABLE=RULE_CONFLICTS_TABLE,
+    RULE_IMPACT_TABLE=RULE_IMPACT_TABLE,
+    TRANSACTIONS_TABLE=TRANSACTIONS_TABLE,
+)
+
+SCHEDULED_QUERIES = ("transactions_rule_impact", "rule_conflicts", "consumer_summary")
+
+
+@functools.cache
+def scheduled_query(name: str) -> str:
+    """Reads a scheduled query from the package's sql/ directory with its table names filled in."""
+    template = (resources.files(__package__) / "sql" / f"{name}.sql").read_text(encoding="utf-8")
+    return template.format(**_TABLES)
@@ -1,135 +1,70 @@
 # txn_insights_agent/agent.py
 
-import os
+import asyncio
+import concurrent.futures
+import functools
+import json
+import re
+import threading
+import time
+from typing import Any
+import google.auth
+from cachetools import TTLCache, cached
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
 from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest
 from google.adk.tools import FunctionTool
 from google.adk.tools.bigquery import BigQueryToolset
 from google.adk.tools.bigquery.config import BigQueryToolConfig, WriteMode
 from google.cloud import bigquery
 from google.api_core import exceptions
 
-# --- Constants ---
-PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "fsi-banking-agentspace")
-DATASET_ID = "equifax_txns"
-TRANSACTIONS_TABLE = f"{PROJECT_ID}.{DATASET_ID}.transactions"
-RULES_TABLE = f"{PROJECT_ID}.{DATASET_ID}.categorization_rules"
-
-# --- Agent Instructions ---
-AGENT_INSTRUCTIONS = f"""
-# 1. Core Persona & Guiding Principles
-* **Persona:** You are TXN Insights Agent, an expert financial data analyst. 🤖🏦
-* **Personality:** Professional, insightful, proactive, and friendly.
-* **Primary Goal:** Empower users to make fast and fair credit decisions by transforming raw transaction data into clear, actionable intelligence.
-
-### Guiding Principles
-* **Accuracy First:** ✅ Clean and accurately categorize data before analysis.
-* **Be a Guide, Not a Gatekeeper:** 🗺️ Offer clear analytical paths and suggestions.
-* **Data to Decision:** 💡 Interpret data, identify trends, and build a financial narrative.
-* **Responsible Stewardship:** 🛡️ Use the `execute_sql` tool for all `SELECT` queries. For `INSERT`, `UPDATE` or `DELETE` statements, you **MUST** first present the exact SQL query in a markdown code block. After the user explicitly types 'CONFIRM', you **MUST** then use the `execute_confirmed_update` tool to run the query. Never use `execute_sql` for write operations.
-* **Visually Appealing:** ✨ Make your responses clear and engaging! Use emojis to add context and personality. All tabular data **MUST** be presented in clean, human-readable **Markdown table format**.
-
-# 2. Session State & Dynamic User Interaction Flow
-You will manage the conversation state using the following session variables: `analysis_level`, `context_value`, `start_date`, `end_date`.
-
-### Step 1: Establish Analysis Scope
-* **IF `analysis_level` is NOT SET:** Greet the user and prompt them to select the desired level of analysis: 1. 👤 Consumer Level, 2. 👥 Persona Level, 3. 🌐 All Data.
-* **ONCE a level is chosen:** Set `session.state.analysis_level` to the user's choice.
-
-### Step 2: Define Context & Time Period
-* **IF `analysis_level` is SET but `context_value` is NOT SET:**
-    * If `analysis_level` is 'Consumer', query for distinct `consumer_name` and ask the user to select one.
-    * If `analysis_level` is 'Persona', query for distinct `persona_type` and ask the user to select one.
-    * If `analysis_level` is 'All', set `context_value` to 'All Data' and proceed.
-* **ONCE context is chosen:** Set `session.state.context_value`.
-* **IF `context_value` is SET but `start_date` is NOT SET:** Prompt for the time period in a numbered list: 🗓️ Last 3 / 6 / 12 months, Custom Date Range, or All available data.
-* **ONCE time period is chosen:** Calculate and set `start_date` and `end_date` in the session state and confirm the context with the user.
-
-### Step 3: Present Main Menu & Manage Session
-* **IF `analysis_level`, `context_value`, and `start_date` are ALL SET:** Display the main menu corresponding to the `analysis_level`.
-* **After each task, prompt for the next action:** 1. 📈 Run another analysis, 2. ⏳ Change the time period, 3. 🔄 Start over, or 4. 🏁 End session.
-
-# 3. Core Analysis Menus & Workflows
-**CRITICAL:** For all analyses, construct a single, valid BigQuery `SELECT` query and execute it using the `execute_sql` tool. Use session state for dynamic WHERE clauses. Format all tabular results as Markdown tables.
-
-### 👤 Consumer Level Menu (if `analysis_level` == 'Consumer')
-*Introduction: "Analyzing **{{session.state.context_value}}** from **{{session.state.start_date}}** to **{{session.state.end_date}}**. What would you like to see?"*
-1.  📄 Full Financial Profile
-2.  💰 Income Analysis
-3.  🛒 Spending Analysis
-4.  📊 Income Stability Report
-5.  🩺 Financial Health & Risk Score
-6.  🚩 Flag Unusual Transactions
-7.  ❓ Ask a Custom Question
-
-### 👥 Persona Level Menu (if `analysis_level` == 'Persona')
-*Introduction: "Analyzing the **{{session.state.context_value}}** persona from **{{session.state.start_date}}** to **{{session.state.end_date}}**. What would you like to see?"*
-1.   snapshot Persona Financial Snapshot
-2.  💸 Average Income Analysis
-3.  🛍️ Common Spending Patterns
-4.  📈 Persona Income Stability Trends
-5.  ⚠️ Aggregate Risk Factors
-6.  👽 Identify Consumer Outliers
-7.  ❓ Ask a Custom Question
-
-### 🌐 All Data Level Menu (if `analysis_level` == 'All')
-*Introduction: "Analyzing **All Available Data** from **{{session.state.start_date}}** to **{{session.state.end_date}}**. What would you like to see?"*
-1.  ⚙️ Overall System Health
-2.  🔬 Persona Comparison Report
-3.  🧩 Categorization Method Analysis
-4.  ⚔️ Rule Analysis & Conflict Resolution
-5.  🛠️ Enhance Categorization Rules
-6.  🔁 Recurring Transaction Analysis
-7.  🌍 Macro Income & Spending Trends
-8.  ❓ Ask a Custom Question
-
-# 4. Detailed Workflow: Interactive Rule Conflict Resolution
-If the user selects "Rule Analysis & Conflict Resolution":
-
-1.  **🔍 Initial Report:** Execute a conflict identification query using `execute_sql`. **A conflict is defined as multiple active rules existing for the same `identifier`, `rule_type`, `transaction_type`, and `persona_type`.** Rules that are identical except for having different `persona_type` values are NOT conflicts. State the total number of conflicts found. Present a user-friendly summary of the top 3-5 conflicts. Then, ask the user if they want to begin the interactive resolution process.
-2.  **📊 Isolate & Analyze:** If yes, handle one conflict at a time. For the group of conflicting rules (which will all share the same `persona_type`), present a detailed side-by-side comparison in a Markdown table. The table **MUST** include columns for `rule_id`, `rule_type`, `identifier`, `persona_type`, `transaction_type`, `category_l1`, `category_l2`, `is_recurring_rule`, `confidence_score`, and the **Impact** (the count of transactions that would be affected by each rule). You must run a separate `COUNT(*)` query for each rule to determine its impact.
-3.  **💡 Propose & Confirm:** Based on the detailed comparison, propose solutions such as deactivating a rule, changing a rule's `persona_type`, or adjusting its `confidence_score`. If a solution requires a database modification, generate the `UPDATE` or `INSERT` statement.
-4.  **▶️ Execute:** Display the exact SQL in a code block. After the user types 'CONFIRM', use the `execute_confirmed_update` tool to run the query.
-5.  **✅ Verify & Loop:** Report the success and move to the next conflict.
-
-# 5. Detailed Workflow: Enhance Categorization Rules
-If the user selects "Enhance Categorization Rules":
-1. **Present Options:** Ask the user if they would like to:
-    1. ✍️ Create a custom rule.
-    2. 🤖 Get AI-powered rule recommendations.
-2. **Workflow 1: Create Custom Rule:**
-    a. **Gather Attributes:** Prompt the user for each required rule attribute (e.g., `merchant_name`, `transaction_description`, `category`).
-    b. **Construct Query:** Create a valid `INSERT` statement for the `{RULES_TABLE}`.
-    c. **Confirm & Execute:** Show the user the exact SQL query. After they type 'CONFIRM', execute it using the `execute_confirmed_update` tool.
-    d. **Verify:** Report the outcome of the operation.
-3. **Workflow 2: AI-Powered Recommendations:**
-    a. **Analyze Transaction Patterns:** Execute a `SELECT` query on the `{TRANSACTIONS_TABLE}` to identify the top 10 most frequent transaction patterns based on 'category_l1', 'category_l2', 'transaction_type', 'amount', `merchant_name_cleaned` and `description_cleaned`.
-        - This analysis must not be limited to uncategorized transactions.
-        - The agent must use robust reasoning to identify potential patterns, using clues from all the available data, and shouldn't rely on simple single field matching.
-    b. **Generate & Cross-Reference Suggestions:** For each identified pattern, intelligently suggest a new rule. Before presenting to the user, you **MUST** first execute a `SELECT` query on the `{RULES_TABLE}` to ensure a rule with the same `merchant_name` and `transaction_description` does not already exist. This prevents duplicate or conflicting recommendations.
-    c. **Interactive Review:** Present one valid, non-conflicting recommendation at a time. For each, ask the user to **Approve 👍**, **Skip ⏭️**, or **Bulk Approve ALL ✅**.
-    d. **Execute Approved Rules:**
-        * If **Approve**, construct the `INSERT` statement for that specific rule, ask for 'CONFIRM', and then execute it using `execute_confirmed_update`.
-        * If **Bulk Approve ALL**, construct and execute `INSERT` statements for all remaining recommendations after a single 'CONFIRM'.
-    e. **Loop or Conclude:** Continue to the next recommendation until the list is exhausted or the user stops the process.
-
-# 6. Detailed Workflow: Recurring Transaction Analysis
-If the user selects "Recurring Transaction Analysis":
-
-1.  **🔎 Identify Candidates:** Execute a `SELECT` query using `execute_sql` on the `{TRANSACTIONS_TABLE}` to find potential recurring transactions. Your query should look for groups of transactions that share the same `merchant_name_cleaned` and `transaction_type`, have occurred at least 3 times within the selected date range, and are currently marked as `is_recurring = FALSE` or `is_recurring IS NULL`. Your analysis should consider the consistency of the transaction day and amount.
-2.  **📋 Present Recommendations:** For each identified pattern, present a summary to the user in a Markdown table. Include the `merchant_name_cleaned`, `transaction_type`, the count of transactions, the average amount, and the average day of the month.
-3.  **Choose Action:** For each recommendation, ask the user what action they'd like to take:
-    a. **Update Transactions Only:** Mark all transactions in this group as `is_recurring = TRUE`.
-    b. **Update Transactions & Create Rule:** Mark the transactions as recurring AND create a new rule in `{RULES_TABLE}` to automatically tag future, similar transactions. The rule should be based on the `merchant_name_cleaned` and `transaction_type`, and set `is_recurring_rule = TRUE`.
-    c. **Skip:** Make no changes.
-4.  **Confirm & Execute:**
-    a. If the user chooses an action that modifies the database, generate the required `UPDATE` and/or `INSERT` statement(s).
-    b. Present the exact SQL query/queries in a markdown code block.
-    c. After the user explicitly types 'CONFIRM', use the `execute_confirmed_update` tool to run the query/queries.
-5.  **Verify & Loop:** Report the success of the operation and move to the next recommendation until the list is exhausted or the user chooses to stop.
-"""
+try:  # Optional: only used to lint SELECTs before they are sent to BigQuery.
+    import sqlglot
+    from sqlglot import exp as sqlglot_exp
+except ImportError:
+    sqlglot = None
+
+from ._config import (
+    PROJECT_ID,
+    AGENT_MODEL,
+    CONFIRM_MODEL,
+    MAX_UPDATE_BYTES,
+    MAX_SELECT_BYTES,
+    CONSUMERS_VIEW,
+    CONSUMER_SUMMARY_TABLE,
+    TRANSACTIONS_TABLE,
+    DISTINCT_CACHE_TTL_SECONDS,
+    RULES_TABLE,
+    QUERY_CACHE_TTL_SECONDS,
+    QUERY_CACHE_MAX_ENTRIES,
+    MAX_RESULT_ROWS,
+    QUERY_API_TIMEOUT_SECONDS,
+    QUERY_WAIT_TIMEOUT_SECONDS,
+)
+from ._instructions import INSTRUCTIONS as AGENT_INSTRUCTIONS
+from ._sql import (
+    DML_PREFIX,
+    normalize_sql,
+    scheduled_query,
+    table_pattern,
+    to_query_parameters,
+)
 
 # --- Tool Configuration ---
 
+class _CachedDeclarationTool(FunctionTool):
+    """A FunctionTool that builds its declaration from the function signature and docstring once, not on every model call."""
+
+    @functools.cached_property
+    def _declaration(self):
+        return super()._get_declaration()
+
+    def _get_declaration(self):
+        return self._declaration
+
 # 1. Read-Only Toolset for Safe Analysis
 read_only_tool_config = BigQueryToolConfig(write_mode=WriteMode.BLOCKED)
 bigquery_read_toolset = BigQueryToolset(
@@ -138,41 +73,472 @@ bigquery_read_toolset = BigQueryToolset(
 
 # 2. Write-Enabled Function Tool for Confirmed Updates
 # This provides a separate, controlled path for making changes to the database.
-bq_client = bigquery.Client(project=PROJECT_ID)
+# Short-query optimized mode lets BigQuery skip job creation for fast queries.
+# `query_and_wait` needs google-cloud-bigquery>=3.20 and `JobCreationMode`
+# >=3.31; older clients fall back to a regular query job.
+_HAS_QUERY_AND_WAIT = hasattr(bigquery.Client, "query_and_wait")
+_JOB_CREATION_MODE = getattr(getattr(bigquery.enums, "JobCreationMode", None), "JOB_CREATION_OPTIONAL", None)
+
+# Settings shared by every query the agent runs, applied once as the client's default job config.
+# Per-call configs only add what differs (parameters, dry run, byte caps); the labels make the
+# agent's jobs easy to find and attribute in INFORMATION_SCHEMA and billing exports.
+_BASE_JOB_CONFIG = bigquery.QueryJobConfig(
+    use_legacy_sql=False,
+    labels={"agent": "txn_insights"},
+    priority=bigquery.QueryPriority.INTERACTIVE,
+)
+# Jobs that do get created are named with this prefix instead of a bare random id.
+_JOB_ID_PREFIX = "txn_agent_"
+
+@functools.lru_cache(maxsize=1)
+def _get_credentials():
+    """Discovers the application default credentials once; both BigQuery clients share them."""
+    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    return credentials
+
+@functools.lru_cache(maxsize=1)
+def _get_bq_client() -> bigquery.Client:
+    """Builds the shared BigQuery client on first use, so importing the agent does no credential discovery."""
+    client_options = {}
+    if _JOB_CREATION_MODE is not None:
+        client_options["default_job_creation_mode"] = _JOB_CREATION_MODE
+
+    # A single keep-alive session so TLS handshakes and auth are amortized across calls.
+    credentials = _get_credentials()
+    http_session = AuthorizedSession(credentials)
+    http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+    return bigquery.Client(
+        project=PROJECT_ID,
+        credentials=credentials,
+        _http=http_session,
+        default_query_job_config=_BASE_JOB_CONFIG,
+        **client_options,
+    )
+
+def _start_query(sql_query: str, job_config: bigquery.QueryJobConfig | None = None) -> bigquery.QueryJob:
+    """Starts a query job without waiting for it to finish."""
+    return _get_bq_client().query(
+        sql_query, job_config=job_config, job_id_prefix=_JOB_ID_PREFIX, timeout=QUERY_API_TIMEOUT_SECONDS
+    )
 
-def execute_confirmed_update(sql_query: str) -> str:
+def _query_rows(sql_query: str, job_config: bigquery.QueryJobConfig | None = None, max_results: int | None = None):
     """
-    Executes a confirmed INSERT, UPDATE, or DELETE SQL query against the BigQuery database.
+    Runs a query and waits for up to `max_results` of its rows, using short-query optimized mode when available.
+    Raises concurrent.futures.TimeoutError if the query does not finish within QUERY_WAIT_TIMEOUT_SECONDS;
+    query_and_wait then also cancels the job, so this is for reads only.
+    """
+    if _HAS_QUERY_AND_WAIT:
+        return _get_bq_client().query_and_wait(
+            sql_query,
+            job_config=job_config,
+            api_timeout=QUERY_API_TIMEOUT_SECONDS,
+            wait_timeout=QUERY_WAIT_TIMEOUT_SECONDS,
+            max_results=max_results,
+        )
+    return _start_query(sql_query, job_config).result(timeout=QUERY_WAIT_TIMEOUT_SECONDS, max_results=max_results)
+
+# Identical SELECTs within a session (e.g. revisiting a menu item) are answered from memory.
+_query_cache: dict[str, tuple[float, dict[str, Any]]] = {}
+_query_cache_lock = threading.Lock()
+
+# Re-derives the rule conflict table; the same statement runs as its scheduled query.
+_REFRESH_RULE_CONFLICTS_SQL = scheduled_query("rule_conflicts")
+
+_WRITES_RULES = table_pattern(RULES_TABLE)
+_WRITES_TRANSACTIONS = table_pattern(TRANSACTIONS_TABLE)
+
+def _refresh_derived_tables(sql_query: str) -> str:
+    """Brings the tables derived from whichever base tables a write touched up to date. Returns a note for the agent, if any."""
+    notes = []
+    if _WRITES_RULES.search(sql_query):
+        # The rules table is small, so its conflicts are rebuilt right away; the cap guards against surprises.
+        try:
+            _start_query(
+                _REFRESH_RULE_CONFLICTS_SQL, bigquery.QueryJobConfig(maximum_bytes_billed=MAX_UPDATE_BYTES)
+            ).result(timeout=QUERY_WAIT_TIMEOUT_SECONDS)
+        except Exception as e:  # The write itself has committed; a failed refresh only leaves the summary stale.
+            notes.append(
+                f" Note: the rule conflict summary could not be refreshed ({e}); it may be stale until its next scheduled run."
+            )
+    if _WRITES_TRANSACTIONS.search(sql_query):
+        # Not rebuilt here: the write invalidates the consumer rollup, so a rebuild would rescan the
+        # transactions table. The hourly scheduled run picks the change up instead.
+        notes.append(
+            f" Note: {CONSUMER_SUMMARY_TABLE} is refreshed hourly and will not reflect this change until its next run."
+        )
+    return "".join(notes)
+
+def _after_write(sql_query: str) -> str:
+    """Brings derived state up to date after a successful write. Returns a note for the agent, if any."""
+    # Cached SELECT results may no longer reflect the data; cleared first so a failed refresh cannot skip it.
+    with _query_cache_lock:
+        _query_cache.clear()
+    return _refresh_derived_tables(sql_query)
+
+_DML_STATEMENT_TYPES = frozenset({"INSERT", "UPDATE", "DELETE", "MERGE"})
+
+def _validate_dml(sql_query: str, query_parameters: list) -> tuple[bool, int | None, str | None]:
+    """
+    Dry-runs a write, which catches invalid SQL and oversized writes without running anything or billing any bytes.
+    Returns (ok, total_bytes_processed, error).
+    """
+    try:
+        dry_run_job = _start_query(
+            sql_query,
+            bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=query_parameters),
+        )
+    except exceptions.GoogleAPICallError as e:
+        return False, None, f"Error: BigQuery rejected the statement: {e}"
+    # The prefix check only looks at the first keyword; the dry run reports what the whole text is,
+    # e.g. SCRIPT for `UPDATE ...; DROP TABLE ...`.
+    if dry_run_job.statement_type not in _DML_STATEMENT_TYPES:
+        return False, None, (
+            f"Error: Expected a single INSERT, UPDATE, DELETE, or MERGE statement, "
+            f"but BigQuery parsed a {dry_run_job.statement_type} statement. Submit one statement without ';'."
+        )
+    bytes_processed = dry_run_job.total_bytes_processed
+    if bytes_processed > MAX_UPDATE_BYTES:
+        return False, bytes_processed, (
+            f"Error: This statement would process {bytes_processed:,} bytes, "
+            f"which exceeds the {MAX_UPDATE_BYTES:,} byte limit. Narrow its WHERE clause and try again."
+        )
+    return True, bytes_processed, None
+
+def validate_update(sql_query: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Checks a proposed INSERT, UPDATE, DELETE, or MERGE statement with a BigQuery dry run, without changing any data.
+    Call this BEFORE showing a write statement to the user and asking them to type 'CONFIRM'.
+    Args:
+        sql_query: The SQL INSERT, UPDATE, DELETE, or MERGE statement, using `@name` placeholders for values.
+        params: The value for each `@name` placeholder in `sql_query`, keyed by name (without the `@`).
+    Returns:
+        A dict with a `status` of 'success' (the statement is valid and `bytes_processed` is how much data it will
+        scan) or 'error' (the problem is in `error_details`; fix the statement and validate it again).
+    """
+    sql_query = normalize_sql(sql_query)
+    if not DML_PREFIX.match(sql_query):
+        return {"status": "error", "error_details": "Only INSERT, UPDATE, DELETE, or MERGE statements can be validated with this tool."}
+    try:
+        ok, bytes_processed, error = _validate_dml(sql_query, to_query_parameters(params))
+    except Exception as e:
+        return {"status": "error", "error_details": f"A general error occurred: {e}"}
+    if not ok:
+        return {"status": "error", "bytes_processed": bytes_processed, "error_details": error}
+    return {"status": "success", "bytes_processed": bytes_processed}
+
+def execute_confirmed_update(sql_query: str, params: dict[str, Any] | None = None) -> str:
+    """
+    Executes a confirmed INSERT, UPDATE, DELETE, or MERGE SQL query against the BigQuery database.
     ONLY use this tool after the user has seen the exact SQL query and has explicitly typed 'CONFIRM' in chat.
     This tool CANNOT be used for SELECT statements.
     Args:
-        sql_query: The exact SQL INSERT, UPDATE, or DELETE statement to execute.
+        sql_query: The exact SQL INSERT, UPDATE, DELETE, or MERGE statement to execute, using `@name` placeholders for values.
+        params: The value for each `@name` placeholder in `sql_query`, keyed by name (without the `@`).
     Returns:
         A string confirming the result, e.g., 'Update successful, 1 row(s) affected.'
     """
-    query_lower = sql_query.strip().lower()
-    if not (query_lower.startswith('insert') or query_lower.startswith('update') or query_lower.startswith('delete')):
-        return "Error: This tool can only be used for INSERT, UPDATE, or DELETE statements. Use the execute_sql tool for SELECT queries."
+    sql_query = normalize_sql(sql_query)
+    if not DML_PREFIX.match(sql_query):
+        return "Error: This tool can only be used for INSERT, UPDATE, DELETE, or MERGE statements. Use the execute_sql_cached tool for SELECT queries."
 
+    query_parameters = to_query_parameters(params)
     try:
-        query_job = bq_client.query(sql_query)
-        query_job.result()  # Wait for the job to complete
-        if query_job.num_dml_affected_rows is not None:
-            return f"Operation successful, {query_job.num_dml_affected_rows} row(s) affected."
+        ok, _, error = _validate_dml(sql_query, query_parameters)
+        if not ok:
+            return error
+
+        job_config = bigquery.QueryJobConfig(query_parameters=query_parameters, use_query_cache=True)
+        # Not _query_rows: query_and_wait cancels the job when its wait times out, and a write
+        # the user confirmed should be left to finish rather than cut off partway.
+        result = _start_query(sql_query, job_config)
+        result.result(timeout=QUERY_WAIT_TIMEOUT_SECONDS)  # Wait for the job to complete
+        if result.num_dml_affected_rows is not None:
+            message = f"Operation successful, {result.num_dml_affected_rows} row(s) affected."
         else:
-            return "Operation successful, but the number of affected rows is not available."
+            message = "Operation successful, but the number of affected rows is not available."
+    except concurrent.futures.TimeoutError:
+        return (
+            f"The statement is still running in BigQuery after {QUERY_WAIT_TIMEOUT_SECONDS:.0f} seconds. "
+            "It was not cancelled and may still apply; check its effect with a SELECT before retrying."
+        )
+    except exceptions.GoogleAPICallError as e:
+        return f"An API error occurred: {e}"
+    except Exception as e:
+        return f"A general error occurred: {e}"
+    # Outside the try: the write has committed, so nothing after this point may report it as failed.
+    return message + _after_write(sql_query)
+
+def execute_confirmed_update_batch(sql_statements: list[str], params: dict[str, Any] | None = None) -> str:
+    """
+    Executes several confirmed INSERT, UPDATE, DELETE, or MERGE statements as a single BigQuery transaction: either all of them are applied or none are.
+    ONLY use this tool after the user has seen the exact SQL statements and has explicitly typed 'CONFIRM' in chat.
+    This tool CANNOT be used for SELECT statements.
+    Args:
+        sql_statements: The exact SQL INSERT, UPDATE, DELETE, or MERGE statements to execute, in order, one statement per element, using `@name` placeholders for values.
+        params: The value for each `@name` placeholder used in any of the statements, keyed by name (without the `@`).
+    Returns:
+        A string confirming the result, e.g., 'Operation successful, 3 statement(s) executed, 12 row(s) affected.'
+    """
+    if not sql_statements:
+        return "Error: No statements were provided."
+    statements = [normalize_sql(statement).rstrip(";") for statement in sql_statements]
+    if not all(DML_PREFIX.match(statement) for statement in statements):
+        return "Error: This tool can only be used for INSERT, UPDATE, DELETE, or MERGE statements. Use the execute_sql_cached tool for SELECT queries."
+
+    query_parameters = to_query_parameters(params)
+    script = "BEGIN TRANSACTION; " + "; ".join(statements) + "; COMMIT TRANSACTION;"
+    try:
+        for statement in statements:
+            ok, _, error = _validate_dml(statement, query_parameters)
+            if not ok:
+                return error
+
+        # One script job instead of one DML job per statement; a failing statement rolls the whole transaction back.
+        script_job = _start_query(script, bigquery.QueryJobConfig(query_parameters=query_parameters))
+        script_job.result(timeout=QUERY_WAIT_TIMEOUT_SECONDS)
+    except concurrent.futures.TimeoutError:
+        return (
+            f"The transaction is still running in BigQuery after {QUERY_WAIT_TIMEOUT_SECONDS:.0f} seconds. "
+            "It was not cancelled and may still commit; check its effect with a SELECT before retrying."
+        )
     except exceptions.GoogleAPICallError as e:
         return f"An API error occurred: {e}"
     except Exception as e:
         return f"A general error occurred: {e}"
 
-update_tool = FunctionTool(execute_confirmed_update)
+    # The transaction has committed; the row count is reported on a best-effort basis.
+    try:
+        affected_rows = sum(
+            child_job.num_dml_affected_rows or 0
+            for child_job in _get_bq_client().list_jobs(parent_job=script_job.job_id, timeout=QUERY_API_TIMEOUT_SECONDS)
+            if isinstance(child_job, bigquery.QueryJob)
+        )
+        message = f"Operation successful, {len(statements)} statement(s) executed, {affected_rows} row(s) affected."
+    except Exception:
+        message = f"Operation successful, {len(statements)} statement(s) executed and committed, but the affected row count is unavailable."
+    return message + _after_write(script)
+
+validate_update_tool = _CachedDeclarationTool(validate_update)
+update_tool = _CachedDeclarationTool(execute_confirmed_update)
+batch_update_tool = _CachedDeclarationTool(execute_confirmed_update_batch)
+
+# 3. Cached Read Tools
+# SetOperation is the common base of UNION / INTERSECT / EXCEPT; older sqlglot releases call it Union.
+_SQLGLOT_SET_OPERATION = (getattr(sqlglot_exp, "SetOperation", None) or sqlglot_exp.Union) if sqlglot else None
+
+def _projects_star(query) -> bool:
+    """Whether the final projection of a query, or of any branch of a set operation, contains `*`."""
+    if isinstance(query, sqlglot_exp.Subquery):
+        return _projects_star(query.unnest())
+    if isinstance(query, _SQLGLOT_SET_OPERATION):
+        return _projects_star(query.left) or _projects_star(query.right)
+    return isinstance(query, sqlglot_exp.Query) and any(column.is_star for column in query.selects)
+
+def _star_projection_error(sql_query: str) -> str | None:
+    """
+    Rejects a top-level `SELECT *` / `SELECT t.*`, including one in any branch of a UNION / INTERSECT / EXCEPT,
+    which reads every column of the wide tables. Returns an error, if any.
+    """
+    if sqlglot is None:
+        return None
+    try:
+        parsed = sqlglot.parse_one(sql_query, read="bigquery")
+    except sqlglot.errors.SqlglotError:
+        # Leave anything sqlglot cannot parse to the dry run.
+        return None
+    if _projects_star(parsed):
+        return "Enumerate the columns you need explicitly instead of selecting `*`; BigQuery bills for every column read."
+    return None
+
+def _run_select(sql_query: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Runs a single SELECT query and renders its result as a Markdown table."""
+    error = _star_projection_error(sql_query)
+    if error:
+        return {"status": "error", "error_details": error}
+
+    query_parameters = to_query_parameters(params)
+    # A dry run confirms the statement is a plain SELECT and prices it before anything executes.
+    dry_run_job = _start_query(
+        sql_query,
+        bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=query_parameters),
+    )
+    if dry_run_job.statement_type != "SELECT":
+        return {"status": "error", "error_details": "Only SELECT queries can be run with this tool."}
+    bytes_processed = dry_run_job.total_bytes_processed
+    if bytes_processed > MAX_SELECT_BYTES:
+        return {
+            "status": "too_large",
+            "bytes_processed": bytes_processed,
+            "suggestion": "Add a transaction_date filter, narrow the context, or query a rollup table.",
+        }
+
+    # jobs.query fast path (via _query_rows) with the result cache on and a hard billing cap as a backstop to the dry run.
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=query_parameters,
+        use_query_cache=True,
+        maximum_bytes_billed=MAX_SELECT_BYTES,
+    )
+    # Only the first MAX_RESULT_ROWS rows are fetched, so a broad query cannot flood the prompt or the cache;
+    # a page that small comes back fastest over REST.
+    rows = _query_rows(sql_query, job_config=job_config, max_results=MAX_RESULT_ROWS)
+    df = rows.to_dataframe(create_bqstorage_client=False)
+    total_rows = rows.total_rows if rows.total_rows is not None else len(df)
+    return {
+        "status": "success",
+        "bytes_processed": bytes_processed,
+        "rows": df.to_markdown(index=False) if not df.empty else "The query returned no rows.",
+        "total_rows": total_rows,
+        "truncated": total_rows > len(df),
+    }
+
+def _cached_select(sql_query: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Runs a SELECT through the result cache, keyed on the normalized SQL and its parameters."""
+    # The normalized SQL is both what runs and part of the cache key.
+    sql_query = normalize_sql(sql_query)
+    key = sql_query if not params else f"{sql_query}\n{json.dumps(params, sort_keys=True, default=str)}"
+    with _query_cache_lock:
+        cached = _query_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < QUERY_CACHE_TTL_SECONDS:
+        return cached[1]
+
+    try:
+        result = _run_select(sql_query, params)
+    except concurrent.futures.TimeoutError:
+        return {
+            "status": "error",
+            "error_details": f"The query did not finish within {QUERY_WAIT_TIMEOUT_SECONDS:.0f} seconds. Narrow it or use a rollup table.",
+        }
+    except exceptions.GoogleAPICallError as e:
+        return {"status": "error", "error_details": f"An API error occurred: {e}"}
+    except Exception as e:
+        return {"status": "error", "error_details": f"A general error occurred: {e}"}
+    if result["status"] != "success":
+        return result
+
+    with _query_cache_lock:
+        _query_cache.pop(key, None)
+        if len(_query_cache) >= QUERY_CACHE_MAX_ENTRIES:
+            # Entries are kept in insertion order, so the first one is the oldest.
+            del _query_cache[next(iter(_query_cache))]
+        _query_cache[key] = (time.monotonic(), result)
+    return result
+
+def execute_sql_cached(sql_query: str) -> dict[str, Any]:
+    """
+    Executes a SELECT query against the BigQuery database, reusing the result of an identical query run in the last few minutes.
+    This tool CANNOT be used for INSERT, UPDATE, DELETE, or MERGE statements.
+    Args:
+        sql_query: The exact SQL SELECT statement to execute.
+    Returns:
+        A dict with a `status` of 'success' (with the Markdown table in `rows` and the scanned bytes in
+        `bytes_processed`), 'too_large' (the query was not run because it would scan too much data) or 'error'.
+        `rows` holds only the first rows of a large result; when `truncated` is true, `total_rows` is the full count, so
+        aggregate further or add ORDER BY ... LIMIT instead of presenting a partial table as complete.
+    """
+    return _cached_select(sql_query)
+
+def execute_sql_parameterized(sql_query: str, params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Executes a SELECT query with `@name` query parameters against the BigQuery database, reusing recent identical results.
+    This tool CANNOT be used for INSERT, UPDATE, DELETE, or MERGE statements.
+    Args:
+        sql_query: The exact SQL SELECT statement to execute, using `@name` placeholders for values.
+        params: The value for each `@name` placeholder, keyed by name (without the `@`). Lists become ARRAY
+            parameters (use them with `IN UNNEST(@name)`), and 'YYYY-MM-DD' strings become DATE parameters.
+    Returns:
+        The same result dict as `execute_sql_cached`.
+    """
+    return _cached_select(sql_query, params)
+
+async def execute_sql_batch(queries: list[str], params: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+    """
+    Executes several independent SELECT queries concurrently against the BigQuery database.
+    Use this tool when one analysis needs multiple aggregations that do not depend on each other's results.
+    This tool CANNOT be used for INSERT, UPDATE, DELETE, or MERGE statements.
+    Args:
+        queries: The SELECT statements to execute, optionally using `@name` placeholders for values.
+        params: The value for each `@name` placeholder used in any of the queries, keyed by name (without the `@`),
+            as for `execute_sql_parameterized`.
+    Returns:
+        A list with one `execute_sql_cached`-style result dict per query, in the same order as `queries`.
+    """
+    # Independent queries run in parallel, so wall time tracks the slowest one rather than their sum.
+    return list(await asyncio.gather(*(asyncio.to_thread(_cached_select, q, params) for q in queries)))
+
+cached_read_tool = _CachedDeclarationTool(execute_sql_cached)
+parameterized_read_tool = _CachedDeclarationTool(execute_sql_parameterized)
+batch_read_tool = _CachedDeclarationTool(execute_sql_batch)
+
+# 4. Cached Lookup Tools for the Consumer / Persona Pickers
+# The picker values change slowly, so every session within the TTL shares one lookup.
+_distinct_cache = TTLCache(maxsize=16, ttl=DISTINCT_CACHE_TTL_SECONDS)
+
+@cached(_distinct_cache, lock=threading.Lock())
+def _distinct_values(column: str) -> tuple[str, ...]:
+    """Lists the distinct values of a CONSUMERS_VIEW column. Failures raise, so they are never cached."""
+    rows = _query_rows(
+        f"SELECT DISTINCT {column} FROM `{CONSUMERS_VIEW}` ORDER BY {column}",
+        job_config=bigquery.QueryJobConfig(use_query_cache=True),
+    )
+    return tuple(row[column] for row in rows)
+
+def _lookup(column: str) -> dict[str, Any]:
+    """Wraps a cached distinct-value lookup in the tool result format."""
+    try:
+        return {"status": "success", "values": list(_distinct_values(column))}
+    except exceptions.GoogleAPICallError as e:
+        return {"status": "error", "error_details": f"An API error occurred: {e}"}
+    except Exception as e:
+        return {"status": "error", "error_details": f"A general error occurred: {e}"}
+
+def get_distinct_consumers() -> dict[str, Any]:
+    """
+    Lists every consumer available for Consumer Level analysis.
+    Returns:
+        A dict with `status` 'success' and the sorted consumer names in `values`, or `status` 'error'.
+    """
+    return _lookup("consumer_name")
+
+def get_distinct_personas() -> dict[str, Any]:
+    """
+    Lists every persona available for Persona Level analysis.
+    Returns:
+        A dict with `status` 'success' and the sorted persona types in `values`, or `status` 'error'.
+    """
+    return _lookup("persona_type")
+
+consumers_tool = _CachedDeclarationTool(get_distinct_consumers)
+personas_tool = _CachedDeclarationTool(get_distinct_personas)
+
+# --- Model Routing ---
+# A turn that is just the user's 'CONFIRM' is about to run a database write.
+_CONFIRM_TURN = re.compile(r"^\s*CONFIRM\s*$")
+
+def escalate_confirmed_writes(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """Sends the model calls of a 'CONFIRM' turn to CONFIRM_MODEL; every other turn stays on AGENT_MODEL."""
+    user_content = callback_context.user_content
+    user_text = "".join(part.text or "" for part in (user_content.parts or [])) if user_content else ""
+    if _CONFIRM_TURN.match(user_text):
+        llm_request.model = CONFIRM_MODEL
+    return None
 
 # --- Agent Definition ---
 root_agent = Agent(
     name="txn_insights_agent",
-    model="gemini-2.5-flash",
+    model=AGENT_MODEL,
     description="An expert financial data analyst that provides insights from transaction data.",
     instruction=AGENT_INSTRUCTIONS,
-    tools=[bigquery_read_toolset, update_tool],
+    tools=[
+        cached_read_tool,
+        parameterized_read_tool,
+        batch_read_tool,
+        consumers_tool,
+        personas_tool,
+        bigquery_read_toolset,
+        validate_update_tool,
+        update_tool,
+        batch_update_tool,
+    ],
+    before_model_callback=escalate_confirmed_writes,
 )
\ No newline at end of file
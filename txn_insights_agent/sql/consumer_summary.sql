@@ -0,0 +1,47 @@
+-- txn_insights_agent/sql/consumer_summary.sql
+--
+-- One row of headline figures per consumer, read by the Consumer menu's Full
+-- Financial Profile, Income Stability Report and Financial Health & Risk Score
+-- instead of re-aggregating the consumer's history on every request. Built
+-- from the monthly consumer rollup, which is usually far cheaper than
+-- aggregating `transactions`; right after the base table is updated or deleted
+-- from, though, BigQuery may read `transactions` to keep the rollup fresh.
+--
+-- Income is `Credit` transactions and spend is `Debit` transactions:
+--   * income_stability_score: 1 minus the coefficient of variation of monthly
+--     income, clamped to [0, 1]; 1 means the same income every month.
+--   * risk_score: the share of months in which spend exceeded income.
+--
+-- Schedule it hourly; the agent does not rebuild it after its own writes to
+-- `transactions`, so confirmed changes show up on the next run:
+--
+--   bq query --use_legacy_sql=false \
+--     --display_name="consumer_summary" \
+--     --schedule="every 1 hours" \
+--     "$(python main.py sql consumer_summary)"
+
+CREATE OR REPLACE TABLE `{CONSUMER_SUMMARY_TABLE}`
+CLUSTER BY consumer_name
+AS
+WITH monthly AS (
+  SELECT
+    consumer_name,
+    persona_type,
+    mo,
+    SUM(IF(transaction_type = 'Credit', amt, 0)) AS income,
+    SUM(IF(transaction_type = 'Debit', ABS(amt), 0)) AS spend,
+    MAX(last_txn_date) AS last_txn_date
+  FROM `{CONSUMER_ROLLUP_MV}`
+  GROUP BY consumer_name, persona_type, mo
+)
+SELECT
+  consumer_name,
+  persona_type,
+  CAST(SUM(income) AS NUMERIC) AS total_income,
+  CAST(SUM(spend) AS NUMERIC) AS total_spend,
+  GREATEST(0, 1 - IFNULL(SAFE_DIVIDE(STDDEV_POP(income), AVG(income)), 1)) AS income_stability_score,
+  COUNTIF(spend > income) / COUNT(*) AS risk_score,
+  MAX(last_txn_date) AS last_txn_date,
+  CURRENT_TIMESTAMP() AS updated_at
+FROM monthly
+GROUP BY consumer_name, persona_type;
@@ -0,0 +1,29 @@
+-- txn_insights_agent/sql/rule_conflicts.sql
+--
+-- Pre-computed rule conflicts for the Rule Analysis & Conflict Resolution
+-- workflow. A conflict is more than one active rule for the same identifier,
+-- rule_type, transaction_type and persona_type.
+--
+-- The agent re-runs this statement after every confirmed write to
+-- `categorization_rules` (see execute_confirmed_update); schedule it as well to
+-- pick up changes made outside the agent:
+--
+--   bq query --use_legacy_sql=false \
+--     --display_name="rule_conflicts" \
+--     --schedule="every 24 hours" \
+--     "$(python main.py sql rule_conflicts)"
+
+CREATE OR REPLACE TABLE `{RULE_CONFLICTS_TABLE}` AS
+SELECT
+  identifier,
+  rule_type,
+  transaction_type,
+  persona_type,
+  ARRAY_AGG(
+    STRUCT(rule_id, category_l1, category_l2, is_recurring_rule, confidence_score)
+    ORDER BY confidence_score DESC
+  ) AS conflicts
+FROM `{RULES_TABLE}`
+WHERE is_active
+GROUP BY identifier, rule_type, transaction_type, persona_type
+HAVING COUNT(*) > 1;
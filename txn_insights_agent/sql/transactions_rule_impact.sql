@@ -0,0 +1,29 @@
+-- txn_insights_agent/sql/transactions_rule_impact.sql
+--
+-- Daily rollup used by the Rule Conflict Resolution workflow to size the
+-- impact of each categorization rule. Schedule it once per day:
+--
+--   bq query --use_legacy_sql=false \
+--     --display_name="transactions_rule_impact" \
+--     --schedule="every 24 hours" \
+--     "$(python main.py sql transactions_rule_impact)"
+--
+-- Clustering on the rule match keys keeps each impact lookup to the rows of a
+-- single identifier; partitioning prunes to the session's date range. A day of
+-- staleness is acceptable because rule changes are applied manually.
+
+CREATE OR REPLACE TABLE `{RULE_IMPACT_TABLE}`
+PARTITION BY transaction_date
+CLUSTER BY identifier, transaction_type, persona_type, category_l1
+AS
+SELECT
+  merchant_name_cleaned AS identifier,
+  transaction_type,
+  persona_type,
+  category_l1,
+  category_l2,
+  transaction_date,
+  COUNT(*) AS n,
+  SUM(amount) AS amt
+FROM `{TRANSACTIONS_TABLE}`
+GROUP BY identifier, transaction_type, persona_type, category_l1, category_l2, transaction_date;